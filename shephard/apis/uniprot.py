@@ -31,9 +31,11 @@ def uniprot_accession_from_line(line):
     Parameters
     -----------
 
-    line : string
+    line : string or bytes
         String where we expect the uniprot ID to be contained within two 'pipe' 
-        characters ('|'). 
+        characters ('|'). If a bytes object is passed (e.g. a header read 
+        directly from a file opened in binary mode) only the accession 
+        itself is decoded.
 
     Returns
     -----------
@@ -43,8 +45,24 @@ def uniprot_accession_from_line(line):
         conventions this should be true!
 
     """
+    
+    # only the accession is pulled out of the header, rather than splitting
+    # the header into every pipe-delimited field
     try:
-        return line.split('|')[1].strip()
+        is_bytes = isinstance(line, bytes)
+        pipe = b'|' if is_bytes else '|'
+
+        _, found, rest = line.partition(pipe)
+        if not found:
+            raise ValueError
+
+        accession, _, _ = rest.partition(pipe)
+        accession = accession.strip()
+        if is_bytes:
+            accession = accession.decode()
+
+        return accession
+        
     except:
         raise UtilitiesException('Unable to parse string [%s] to identify uniprot ID' %(line))
 
@@ -8,7 +8,15 @@ Contact: (alex.holehouse@wustl.edu, g.ginell@wustl.edu)
 Holehouse Lab - Washington University in St. Louis
 """
 
+import multiprocessing
+import os
+
 from shephard.exceptions import InterfaceException
+import shephard.exceptions as shephard_exceptions
+
+# positions parsed from domain and site files are stored as signed 64-bit
+# ints, so any position outside +/- MAX_POSITION is treated as a bad line
+MAX_POSITION = 2**63 - 1
 
 
 ## ------------------------------------------------------------------------
@@ -308,6 +316,150 @@ def parse_key_value_pairs(split_line, filename, linecount, line):
     return attributes
 
 
+## ------------------------------------------------------------------------
+##
+def bad_line_message(filename, linecount, error, line):
+    """
+    Function that builds the message reported when a line in a domains or
+    sites file cannot be parsed.
+
+    Parameters
+    -------------
+    filename : str
+        Name of the file being parsed
+
+    linecount : int
+        Line number (1-indexed) of the bad line
+
+    error : str
+        Description of why the line could not be parsed
+
+    line : bytes
+        The (stripped) bad line
+
+    Returns
+    -----------
+    str
+        Message to be printed as a warning or passed to an exception
+
+    """
+
+    return 'Failed parsing file [%s] on line [%i].\n\nException raised: %s\n\nline printed below:\n%s'%(filename, linecount, error, line.decode('utf-8', 'replace'))
+
+
+## ------------------------------------------------------------------------
+##
+def decoded_error_message(e, conversions):
+    """
+    Function that returns the message for an exception raised while 
+    parsing bytes fields from a line, worded as it would be had the 
+    fields been parsed as strings. This matters because int() and float()
+    quote bytes arguments (e.g. b'1.0' rather than '1.0') in their error
+    messages, which end up in user-facing warnings.
+
+    Only called once a line has already failed, so re-running the 
+    conversions here costs nothing on good lines.
+
+    Parameters
+    -------------
+    e : Exception
+        Exception raised while parsing the line
+
+    conversions : iterable
+        (function, field) pairs, where function (e.g. int or float) was 
+        applied to the bytes field while parsing the line. These are 
+        re-run, in order, on the stripped and decoded fields.
+
+    Returns
+    -----------
+    str
+        Message from the first conversion that fails on the decoded 
+        fields, or str(e) if none do (i.e. the failure was not in a 
+        conversion)
+
+    """
+
+    for function, field in conversions:
+        try:
+            function(field.strip().decode('utf-8', 'replace'))
+        except Exception as str_e:
+            return str(str_e)
+
+    return str(e)
+
+
+## ------------------------------------------------------------------------
+##
+def parse_key_value_pairs_bytes(tail, delimiter, filename, linecount, line):
+    """
+    Helper function for parsing input files that have attributes (for 
+    Domains and Sites), where the attributes are passed as the raw bytes
+    of the end of a line.
+
+    This behaves like parse_key_value_pairs() but rather than taking a 
+    list of already-split strings, the delimiter and ':' positions are
+    found directly in the bytes tail and each key and value is sliced out
+    and decoded, so no intermediate list is built for each key-value pair.
+    Note that values will always be strings.
+    
+    Parameters
+    -------------
+    tail : bytes
+        Bytes containing one or more <KEY> : <VALUE> entries separated
+        by the delimiter
+
+    delimiter : bytes
+        Delimiter separating key-value pairs
+
+    filename : string
+        Name of the file the calling function is parsing. Only used when 
+        raising an exception.
+
+    linecount : int
+        Current line number the file processing is on. Only used when 
+        raising an exception.
+
+    line : bytes
+        Full line that the file processing is on. Again, only used when 
+        raising an exception
+
+    """
+
+    attributes = {}
+
+    pos = 0
+    end = len(tail)
+    step = len(delimiter)
+
+    while True:
+
+        # find the end of this key-value pair and the ':' that splits it 
+        field_end = tail.find(delimiter, pos)
+        if field_end == -1:
+            field_end = end
+
+        split_pos = tail.find(b':', pos, field_end)
+        if split_pos == -1:
+            raise InterfaceException(f'Failed parsing key-value pairs in file [{filename}] on line [{linecount}]... line printed below:\n{line.decode("utf-8", "replace")}.\nPassed key-value pairs:[{tail.decode("utf-8", "replace")}]')
+
+        # as with parse_key_value_pairs(), anything after a second ':' is ignored
+        value_end = tail.find(b':', split_pos+1, field_end)
+        if value_end == -1:
+            value_end = field_end
+
+        try:
+            attributes[tail[pos:split_pos].strip().decode('utf-8')] = tail[split_pos+1:value_end].strip().decode('utf-8')
+        except UnicodeDecodeError:
+            raise InterfaceException(f'Failed parsing key-value pairs in file [{filename}] on line [{linecount}]... line printed below:\n{line.decode("utf-8", "replace")}.\nPassed key-value pairs:[{tail.decode("utf-8", "replace")}]')
+
+        if field_end == end:
+            break
+
+        pos = field_end + step
+
+    return attributes
+
+
 ## ------------------------------------------------------------------------
 ##
 def is_comment_line(line):
@@ -334,4 +486,252 @@ def is_comment_line(line):
         return True
         
 
-            
+
+## ------------------------------------------------------------------------
+##
+def read_file_lines(filename, start=0, end=None):
+    """
+    Function that reads a file and returns its lines as bytes objects 
+    (without the trailing newline character). 
+
+    The whole file (or the requested byte range) is read in a single call
+    and split into lines with bytes.splitlines, which scans the buffer in
+    C and builds every line in one pass. As with universal newlines in 
+    text mode, '\\n', '\\r\\n' and '\\r' line endings are all recognized.
+    Decoding is left to the caller.
+
+    Parameters
+    -------------
+    filename : str
+        Name of the file to read
+
+    start : int (default = 0)
+        Byte offset to start reading from. Should be the start of a line.
+
+    end : int (default = None)
+        Byte offset to stop reading at (exclusive). Should be the start of
+        a line (or the end of the file). If None reads to the end of the 
+        file.
+
+    Returns
+    -----------
+    list
+        List with one bytes object per line in the file
+
+    """
+
+    with open(filename, 'rb') as fh:
+        if start:
+            fh.seek(start)
+
+        if end is None:
+            data = fh.read()
+        else:
+            data = fh.read(end - start)
+
+    return data.splitlines()
+
+
+## ------------------------------------------------------------------------
+##
+def find_file_chunks(filename, n_chunks):
+    """
+    Function that splits a file into (up to) n_chunks contiguous byte 
+    ranges of roughly equal size, where every range starts at the 
+    beginning of a line. This allows a large file to be parsed in 
+    parallel, with each range read by read_file_lines().
+
+    Parameters
+    -------------
+    filename : str
+        Name of the file to split
+
+    n_chunks : int
+        Number of chunks to split the file into. Fewer chunks may be 
+        returned for small files.
+
+    Returns
+    -----------
+    list
+        List of (start, end) tuples, where start and end are byte offsets.
+        Only the bytes around each chunk boundary are read, so line 
+        numbers are not known until the chunks themselves are read.
+
+    """
+
+    size = os.path.getsize(filename)
+
+    chunks = []
+    with open(filename, 'rb') as fh:
+
+        start = 0
+        for idx in range(1, n_chunks+1):
+
+            if start >= size:
+                break
+
+            # the last chunk runs to the end of the file, otherwise move
+            # the target offset forward to just after the next newline
+            if idx == n_chunks:
+                end = size
+            else:
+                target = max(start, (size * idx) // n_chunks)
+                fh.seek(target)
+                fh.readline()
+                end = fh.tell()
+
+            if end <= start:
+                continue
+
+            chunks.append((start, end))
+            start = end
+
+    return chunks
+
+
+## ------------------------------------------------------------------------
+##
+def merge_column_dictionaries(list_of_dictionaries):
+    """
+    Function that merges dictionaries mapping a key to a tuple of parallel
+    column lists (as generated when parsing chunks of a file), 
+    concatenating the columns of keys found in more than one dictionary.
+    Dictionaries are merged in the order passed, so the order of records 
+    within each key is preserved.
+
+    Parameters
+    -------------
+    list_of_dictionaries : list of dict
+        List of dictionaries where each value is a tuple of lists
+
+    Returns
+    -----------
+    dict
+        Single merged dictionary
+
+    """
+
+    merged = {}
+    for column_dictionary in list_of_dictionaries:
+        for key, columns in column_dictionary.items():
+            if key in merged:
+                for merged_column, column in zip(merged[key], columns):
+                    merged_column.extend(column)
+            else:
+                merged[key] = columns
+
+    return merged
+
+
+## ------------------------------------------------------------------------
+##
+def _parse_file_chunk(args):
+    """
+    Internal function that reads and parses a byte range from a file. Used
+    as the worker function by parse_file_in_parallel(). 
+
+    Workers do not know the line number their chunk starts on, so bad 
+    lines are not reported here. Instead, parse_lines() is passed a 
+    skipped list and numbers lines from 0 within the chunk: with 
+    skip_bad=True each bad line is recorded in skipped and parsing 
+    continues, while with skip_bad=False (or for a line that cannot be 
+    skipped) parse_lines() stops and returns None.
+
+    Parameters
+    ----------------
+    args : tuple
+        Tuple of (parse_lines, filename, start, end, delimiter, skip_bad)
+
+    Returns
+    --------------
+    tuple
+        Returns a tuple of (column_dictionary, skipped, n_lines), where 
+        column_dictionary is the dictionary returned by parse_lines() (or
+        None if parsing stopped at a bad line), skipped is a list of 
+        (index, error, line) tuples for each bad line skipped, where index
+        is the 0-indexed line within the chunk, and n_lines is the number
+        of lines in the chunk.
+
+    """
+
+    parse_lines, filename, start, end, delimiter, skip_bad = args
+
+    lines = read_file_lines(filename, start, end)
+
+    skipped = []
+    column_dictionary = parse_lines(lines, 0, filename, delimiter, skip_bad, skipped=skipped)
+
+    return column_dictionary, skipped, len(lines)
+
+
+## ------------------------------------------------------------------------
+##
+def parse_file_in_parallel(filename, parse_lines, workers, delimiter, skip_bad):
+    """
+    Function that splits a file into chunks (see find_file_chunks()) and 
+    parses each chunk in its own process, returning the merged column 
+    dictionary (see merge_column_dictionaries()).
+
+    Each worker reports how many lines its chunk held, so absolute line 
+    numbers are only worked out here. Lines skipped by the workers are 
+    reported here, in file order, with their line number in the whole 
+    file. If a worker stops at a bad line it cannot skip (i.e. 
+    skip_bad=False) its chunk is parsed again in this process with the 
+    correct first line number, so the exception raised is the same as 
+    when parsing serially.
+
+    Note that on platforms where worker processes are started with spawn
+    (macOS and Windows) the calling script must be guarded with 
+    ``if __name__ == '__main__':``.
+
+    Parameters
+    -------------
+    filename : str
+        Name of the file to parse
+
+    parse_lines : function
+        Module-level function with the signature 
+        parse_lines(lines, first_line, filename, delimiter, skip_bad, skipped=None)
+        that parses a list of lines into a column dictionary
+
+    workers : int
+        Maximum number of processes to use
+
+    delimiter : str
+        String used as a delimiter on the input file
+
+    skip_bad : bool
+        Flag that means if bad lines are encountered the code will just 
+        skip them (with a warning) rather than raising an exception.
+
+    Returns
+    -----------
+    dict
+        Merged column dictionary for the whole file
+
+    """
+
+    chunks = find_file_chunks(filename, workers)
+    if len(chunks) == 0:
+        return {}
+
+    with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+        results = pool.map(_parse_file_chunk, [(parse_lines, filename, start, end, delimiter, skip_bad) for start, end in chunks])
+
+    column_dictionaries = []
+    first_line = 1
+    for (start, end), (column_dictionary, skipped, n_lines) in zip(chunks, results):
+
+        # a chunk that stopped at a bad line is parsed again here so the 
+        # exception raised has the right line number
+        if column_dictionary is None:
+            column_dictionary = parse_lines(read_file_lines(filename, start, end), first_line, filename, delimiter, skip_bad)
+
+        else:
+            for index, error, line in skipped:
+                shephard_exceptions.print_warning(bad_line_message(filename, first_line + index, error, line) + "\nSkipping this line...")
+
+        column_dictionaries.append(column_dictionary)
+        first_line = first_line + n_lines
+
+    return merge_column_dictionaries(column_dictionaries)
@@ -9,10 +9,147 @@ Holehouse Lab - Washington University in St. Louis
 """
 
 
+import gc
+from array import array
+from collections import defaultdict
+from types import SimpleNamespace
+
 from . import interface_tools 
 from shephard.exceptions import InterfaceException, ProteinException, DomainException
 import shephard.exceptions as shephard_exceptions
 
+## ------------------------------------------------------------------------
+##
+def _parse_domain_lines(lines, first_line, filename, delimiter, skip_bad, skipped=None):
+    """
+    Internal function that parses the lines of a domains file (or a chunk 
+    of one). This does the actual parsing for _DomainsInterface, and is a 
+    module-level function so it can also be run in worker processes.
+
+    Parameters
+    ----------------
+    lines : list of bytes
+        Lines to parse
+
+    first_line : int
+        Line number (1-indexed) of the first line in lines. Only used in
+        error messages.
+
+    filename : str
+        Name of the file being parsed. Only used in error messages.
+
+    delimiter : str
+        String used as a delimiter on the input file. 
+
+    skip_bad : bool
+        Flag that means if bad lines are encountered the code will just 
+        skip them (with a warning) rather than raising an exception.
+
+    skipped : list (default = None)
+        If a list is passed, bad lines are not reported here. Instead, 
+        with skip_bad=True each bad line is appended to skipped as a 
+        (linecount, error, line) tuple and parsing continues, while with 
+        skip_bad=False (or for a line that cannot be skipped) parsing 
+        stops and None is returned. Used by worker processes, which do not
+        know the line numbers needed for error messages.
+
+    Returns
+    --------------
+    dict
+        Dictionary that maps each uniqueID to a tuple of 
+        (starts, ends, domain_types, attributes) lists
+
+    """
+
+    # each unique_ID maps to (starts, ends, domain_types, attributes) lists
+    # (start and end positions are stored as 64-bit C ints rather than as 
+    # boxed Python ints)
+    ID2domain = defaultdict(lambda: (array('q'), array('q'), [], []))
+
+    # lines are parsed as bytes and only the string fields are decoded. 
+    # unique_IDs and domain types repeat heavily, so each distinct value is
+    # decoded once and then shared by every domain that uses it
+    bdelimiter = delimiter.encode('utf-8')
+    decoded = {}
+
+    # bound locally as it is checked on every line
+    max_position = interface_tools.MAX_POSITION
+
+    for linecount, bline in enumerate(lines, first_line):
+
+        # strip once and check for comment lines inline, rather than 
+        # calling is_comment_line() (which strips again) on every line
+        bline = bline.strip()
+        if bline[:1] == b'#':
+            continue
+
+        # the key/value pairs (if present) are left as a single unsplit tail
+        sline = bline.split(bdelimiter, 4)
+
+        # lines with too few fields are caught by a length check rather
+        # than by raising and catching an IndexError
+        if len(sline) < 4:
+            error = 'expected at least 4 fields but found %i' % (len(sline))
+        else:
+            try:
+                unique_ID = decoded.get(sline[0])
+                if unique_ID is None:
+                    unique_ID = decoded[sline[0]] = sline[0].strip().decode('utf-8')
+
+                start = int(sline[1])
+                end = int(sline[2])
+                if abs(start) > max_position or abs(end) > max_position:
+                    raise ValueError('position out of range')
+
+                domain_type = decoded.get(sline[3])
+                if domain_type is None:
+                    domain_type = decoded[sline[3]] = sline[3].strip().decode('utf-8')
+                error = None
+            except Exception as e:
+                error = interface_tools.decoded_error_message(e, ((int, sline[1]), (int, sline[2])))
+
+        if error is not None:
+
+            # in worker processes bad lines are handed back to the parent,
+            # which knows their line number in the whole file
+            if skipped is not None:
+                if not skip_bad:
+                    return None
+                skipped.append((linecount, error, bline))
+                continue
+
+            msg = interface_tools.bad_line_message(filename, linecount, error, bline)
+
+            # if we're skipping bad things then...
+            if skip_bad:
+                shephard_exceptions.print_warning(msg + "\nSkipping this line...")
+                continue
+            else:
+                raise InterfaceException(msg)
+        
+        # most lines have no key/value pairs, in which case no dictionary is 
+        # created here (each Domain creates its own when passed None). 
+        # Otherwise parse the pairs out one at a time
+        if len(sline) == 4:
+            attributes = None
+        else:
+            try:
+                attributes = interface_tools.parse_key_value_pairs_bytes(sline[4], bdelimiter, filename, linecount, bline)
+            except InterfaceException:
+                if skipped is not None:
+                    return None
+                raise
+                                      
+        columns = ID2domain[unique_ID]
+        columns[0].append(start)
+        columns[1].append(end)
+        columns[2].append(domain_type)
+        columns[3].append(attributes)
+
+    # convert to a plain dictionary so the result can be pickled
+    return dict(ID2domain)
+
+
 class _DomainsInterface:
 
     """
@@ -22,7 +159,7 @@ class _DomainsInterface:
     
     """
 
-    def __init__(self, filename, delimiter='\t', skip_bad=True):
+    def __init__(self, filename, delimiter='\t', skip_bad=True, workers=None):
         r"""
         Expect files of the following format:
 
@@ -34,9 +171,20 @@ class _DomainsInterface:
         
         is allowed.
 
-        When created, this constructor parses the keyfile to generate a .data 
-        class object, 
-        which itself maps a uniqueID to a list of domain dictionaries.
+        When created, this constructor parses the keyfile to generate a 
+        .columns class object, which maps a uniqueID to a structure-of-arrays
+        namespace with the following attributes:
+
+            starts               : array('q') of domain start positions
+            ends                 : array('q') of domain end positions
+            domain_types         : list of domain type strings
+            attributes           : list of attribute dictionaries (None where
+                                   a domain has no attributes)
+
+        Storing domains as parallel arrays rather than one dictionary per
+        domain keeps the memory footprint of large files small. The .data
+        property builds the standard domains dictionary (a uniqueID to a 
+        list of domain dictionaries) from these columns on demand.
 
         Domain dictionaries have the following key-value pairs
 
@@ -63,56 +211,66 @@ class _DomainsInterface:
             are encountered the code will just skip them. By default this is 
             true, which adds a certain robustness to file parsing, but could 
             also hide errors. Note that if lines are skipped a warning will be 
-            printed (regardless of verbose flag). 
+            printed (regardless of verbose flag).
+
+        workers : int (default = None)
+            If set to an integer greater than 1 the file is split into 
+            this many chunks (at line boundaries) which are parsed in 
+            parallel in separate processes. Only worthwhile for very
+            large files. Note that on platforms where worker processes
+            are started with spawn (macOS and Windows) the calling 
+            script must be guarded with ``if __name__ == '__main__':``.
 
         """
 
         if delimiter == ':':
             raise InterfaceException('When parsing domain file cannot use ":" as a delimiter because this is used to delimit key/value pairs (if provided)')
 
-        with open(filename,'r') as fh:
-            content = fh.readlines()
+        if workers is None or workers <= 1:
+            ID2domain = _parse_domain_lines(interface_tools.read_file_lines(filename), 1, filename, delimiter, skip_bad)
+        else:
 
-        ID2domain={}
+            # split the file at line boundaries and parse each chunk in its own process
+            ID2domain = interface_tools.parse_file_in_parallel(filename, _parse_domain_lines, workers, delimiter, skip_bad)
 
-        linecount=0
-        for line in content:
+        self.columns = {}
+        for unique_ID, (starts, ends, domain_types, attributes) in ID2domain.items():
+            self.columns[unique_ID] = SimpleNamespace(starts=starts,
+                                                      ends=ends,
+                                                      domain_types=domain_types,
+                                                      attributes=attributes)
 
-            linecount = linecount + 1
 
-            # skip comment lines
-            if interface_tools.is_comment_line(line):
-                continue
+    @property
+    def rows(self):
+        """
+        Returns a dictionary that maps each uniqueID to an iterator of 
+        (start, end, domain_type, attributes) tuples, one per domain.
+        """
 
-            sline = line.strip().split(delimiter)
-            
-            try:
-                unique_ID = sline[0].strip()
-                start = int(sline[1].strip())
-                end = int(sline[2].strip())
-                domain_type = sline[3].strip()
-                attributes = {}
-            except Exception as e:
+        return {unique_ID: zip(c.starts, c.ends, c.domain_types, c.attributes) for unique_ID, c in self.columns.items()}
 
-                msg = 'Failed parsing file [%s] on line [%i].\n\nException raised: %s\n\nline printed below:\n%s'%(filename, linecount, str(e), line)
 
-                # if we're skipping bad things then...
-                if skip_bad:
-                    shephard_exceptions.print_warning(msg + "\nSkipping this line...")
-                    continue
-                else:
-                    raise InterfaceException(msg)
-            
-            # if some key/value pairs were included then parse these out one at a time
-            if len(sline) > 4:
-                attributes = interface_tools.parse_key_value_pairs(sline[4:], filename, linecount, line)
-                                          
-            if unique_ID in ID2domain:
-                ID2domain[unique_ID].append({'start':start, 'end':end, 'domain_type':domain_type, 'attributes':attributes})
-            else:
-                ID2domain[unique_ID] =[{'start':start, 'end':end, 'domain_type':domain_type, 'attributes':attributes}]
+    @property
+    def data(self):
+        """
+        Returns the parsed domains as a standard domains dictionary, where 
+        each uniqueID maps to a list of domain dictionaries.
+        """
 
-        self.data = ID2domain
+        # as in _SitesInterface.data, collection is paused while the 
+        # (all surviving) domain dictionaries are built
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            ID2domain = {}
+            for unique_ID, c in self.columns.items():
+                ID2domain[unique_ID] = [{'start':start, 'end':end, 'domain_type':domain_type, 'attributes':attributes if attributes is not None else {}} for start, end, domain_type, attributes in zip(c.starts, c.ends, c.domain_types, c.attributes)]
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        return ID2domain
 
 
 
@@ -125,7 +283,7 @@ class _DomainsInterface:
 
 ## ------------------------------------------------------------------------
 ##
-def add_domains_from_file(proteome, filename, delimiter='\t', autoname=False, return_dictionary=False, safe=True, skip_bad=True, verbose=True):
+def add_domains_from_file(proteome, filename, delimiter='\t', autoname=False, return_dictionary=False, safe=True, skip_bad=True, verbose=True, workers=None):
     r"""
     Function that takes a correctly formatted shephard 'domains' file and 
     reads all domains into the passed Proteome.
@@ -199,6 +357,15 @@ def add_domains_from_file(proteome, filename, delimiter='\t', autoname=False, re
         Flag that defines how 'loud' output is. Will warn about errors on 
         adding domains.
 
+    workers : int (default = None)
+        If set to an integer greater than 1 the file is split into this 
+        many chunks which are parsed in parallel in separate processes. 
+        This is only worthwhile for very large files, where parsing 
+        dominates over the cost of starting the worker processes. Note 
+        that on platforms where worker processes are started with spawn 
+        (macOS and Windows) the calling script must be guarded with 
+        ``if __name__ == '__main__':``.
+
     Returns
     -----------
     None or dict
@@ -214,13 +381,13 @@ def add_domains_from_file(proteome, filename, delimiter='\t', autoname=False, re
     interface_tools.check_proteome(proteome, 'add_domains_from_file (si_domains)')
 
     # next read in the file
-    domains_interface = _DomainsInterface(filename, delimiter, skip_bad=skip_bad)
+    domains_interface = _DomainsInterface(filename, delimiter, skip_bad=skip_bad, workers=workers)
 
     if return_dictionary:
         return domains_interface.data
 
-    # finally add the domains from the dictionary generated by the DomainsInterface parser
-    add_domains_from_dictionary(proteome, domains_interface.data, autoname=autoname, safe=safe, verbose=verbose)
+    # finally add the domains from the columns generated by the DomainsInterface parser
+    __add_domain_rows(proteome, domains_interface.rows, autoname=autoname, safe=safe, verbose=verbose)
 
 
 
@@ -300,33 +467,65 @@ def add_domains_from_dictionary(proteome, domain_dictionary, autoname=False, saf
 
     # check first argument is a proteome
     interface_tools.check_proteome(proteome, 'add_domains (si_domains)')
-    
+
+    # convert each list of domain dictionaries into (start, end, domain_type, attributes) rows
+    uid2rows = {}
+    for unique_ID, domains in domain_dictionary.items():
+        uid2rows[unique_ID] = ((d['start'], d['end'], d['domain_type'], d.get('attributes')) for d in domains)
+
+    __add_domain_rows(proteome, uid2rows, autoname=autoname, safe=safe, verbose=verbose)
+
+
+## ------------------------------------------------------------------------
+##
+def __add_domain_rows(proteome, uid2rows, autoname=False, safe=True, verbose=True):
+    """
+    Internal function that adds domains to the proteins in the Proteome, 
+    where domains are passed as a dictionary that maps unique_IDs to an 
+    iterable of (start, end, domain_type, attributes) tuples. This is 
+    called internally by functions that add Domains, and the safe, 
+    autoname and verbose keywords are as described in
+    add_domains_from_dictionary().
+
+    Parameters
+    ----------
+    proteome : Proteome object
+        Proteome object to which domains will be added
+
+    uid2rows : dict
+        Dictionary that maps unique_IDs to an iterable of one or more 
+        (start, end, domain_type, attributes) tuples
+
+    Returns
+    -----------
+    None
+        No return value, but domains are added to the Proteome object passed 
+        as the first argument.
+
+    """
+
     for protein in proteome:
-        if protein.unique_ID in domain_dictionary:
-            for domain in domain_dictionary[protein.unique_ID]:
-
-                start       = domain['start']
-                end         = domain['end']
-                domain_type = domain['domain_type']
-                                    
-                try:
-                    ad          = domain['attributes']
-                except:
-                    ad = {}
-                
-                # try and add the domain...
-                try:
-                    protein.add_domain(start, end, domain_type, attributes=ad, safe=safe, autoname=autoname)
-                except (ProteinException, DomainException) as e:
-
-                    msg='- skipping domain at %i-%i on %s' %(start, end, protein)
-                    if safe:
-                        shephard_exceptions.print_and_raise_error(msg, e)
-                    else:
-                        if verbose:
-                            shephard_exceptions.print_warning(msg)
-                            continue
-                
+        rows = uid2rows.get(protein.unique_ID)
+        if rows is None:
+            continue
+
+        # bind the method once per protein rather than once per domain
+        add_domain = protein.add_domain
+        for start, end, domain_type, ad in rows:
+
+            # try and add the domain...
+            try:
+                add_domain(start, end, domain_type, ad, safe, autoname)
+            except (ProteinException, DomainException) as e:
+
+                msg='- skipping domain at %i-%i on %s' %(start, end, protein)
+                if safe:
+                    shephard_exceptions.print_and_raise_error(msg, e)
+                else:
+                    if verbose:
+                        shephard_exceptions.print_warning(msg)
+                        continue
+
 
 ## ------------------------------------------------------------------------
 ##               
@@ -590,7 +789,9 @@ def write_domains(proteome, filename, delimiter='\t', domain_types=None):
 
     """
 
-    with open(filename, 'w') as fh:
+    with open(filename, 'wb', buffering=1<<20) as fh:
+
+        lines = []
         for protein in proteome:
             for d in protein.domains:
 
@@ -600,9 +801,15 @@ def write_domains(proteome, filename, delimiter='\t', domain_types=None):
                     if d.domain_type not in domain_types:
                         continue
 
-                line = __build_domain_line(d, delimiter)
-                
-                fh.write(line)
+                lines.append(__build_domain_line(d, delimiter))
+
+                # encode and write out in batches rather than once per domain
+                if len(lines) == 10000:
+                    fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    lines.clear()
+
+        if lines:
+            fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
 
 ## ------------------------------------------------------------------------
 ##
@@ -641,12 +848,20 @@ def write_domains_from_list(domain_list, filename, delimiter='\t'):
         interface_tools.check_domain(d, 'write_domains_from_list')
 
 
-    with open(filename, 'w') as fh:
+    with open(filename, 'wb', buffering=1<<20) as fh:
+
+        lines = []
         for d in domain_list:
 
-            line = __build_domain_line(d, delimiter)
+            lines.append(__build_domain_line(d, delimiter))
+
+            # encode and write out in batches rather than once per domain
+            if len(lines) == 10000:
+                fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                lines.clear()
 
-            fh.write(line)
+        if lines:
+            fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
 
 
 ## ------------------------------------------------------------------------
@@ -670,32 +885,17 @@ def __build_domain_line(d, delimiter):
     Returns
     --------------
     str
-        Returns a string that is ready to be written to file
+        Returns a string that is ready to be written to file (without a
+        trailing newline)
 
     """
 
-    # systematically construct each line in the file 
-    line = ''
-    line = line + str(d.protein.unique_ID) + delimiter
-
-    start = d.start
-    line = line + str(start) + delimiter
-
-    end = d.end
-    line = line + str(end) + delimiter
-
-    domain_type = d.domain_type    
-            
-    # note last required element has no trailing delimiter
-    line = line + str(domain_type) 
-
-    if d.attributes:
-        for k in d.attributes:
-
-            # 
-            atrbt = interface_tools.full_clean_string(d.attribute(k))
-            line = line + delimiter + f"{k}:{atrbt}" 
+    line = f"{d.protein.unique_ID}{delimiter}{d.start}{delimiter}{d.end}{delimiter}{d.domain_type}"
 
-    line = line + "\n"
+    # .attributes builds a new list of names on each access, so fetch it once
+    attributes = d.attributes
+    if attributes:
+        attribute = d.attribute
+        line = line + delimiter + delimiter.join([f"{k}:{interface_tools.full_clean_string(attribute(k))}" for k in attributes])
 
     return line
@@ -8,13 +8,178 @@ Contact: (alex.holehouse@wustl.edu, g.ginell@wustl.edu)
 Holehouse Lab - Washington University in St. Louis
 """
 
+import gc
+from array import array
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import NamedTuple
+
 from . import interface_tools 
 import shephard.exceptions as shephard_exceptions
-from shephard.exceptions import InterfaceException, ProteinException, SiteException
+from shephard.exceptions import InterfaceException, SiteException
+
+class SiteRow(NamedTuple):
+    """
+    Lightweight record for a single site, as passed to Protein._add_site_rows().
+    Field names match the keys of a site dictionary, so _asdict() returns
+    a valid site dictionary.
+    """
+    position : int
+    site_type : str
+    symbol : str
+    value : float
+    attributes : dict
+
+
+## ------------------------------------------------------------------------
+##
+def _parse_site_lines(lines, first_line, filename, delimiter, skip_bad, skipped=None):
+    """
+    Internal function that parses the lines of a sites file (or a chunk 
+    of one). This does the actual parsing for _SitesInterface, and is a 
+    module-level function so it can also be run in worker processes.
+
+    Parameters
+    ----------------
+    lines : list of bytes
+        Lines to parse
+
+    first_line : int
+        Line number (1-indexed) of the first line in lines. Only used in
+        error messages.
+
+    filename : str
+        Name of the file being parsed. Only used in error messages.
+
+    delimiter : str
+        String used as a delimiter on the input file. 
+
+    skip_bad : bool
+        Flag that means if bad lines are encountered the code will just 
+        skip them (with a warning) rather than raising an exception.
+
+    skipped : list (default = None)
+        If a list is passed, bad lines are not reported here. Instead, 
+        with skip_bad=True each bad line is appended to skipped as a 
+        (linecount, error, line) tuple and parsing continues, while with 
+        skip_bad=False (or for a line that cannot be skipped) parsing 
+        stops and None is returned. Used by worker processes, which do not
+        know the line numbers needed for error messages.
+
+    Returns
+    --------------
+    dict
+        Dictionary that maps each uniqueID to a tuple of 
+        (positions, site_types, symbols, values, attributes) lists
+
+    """
+
+    # each unique_ID maps to (positions, site_types, symbols, values, attributes) lists
+    # (positions are stored as 64-bit C ints rather than as boxed Python ints)
+    ID2site = defaultdict(lambda: (array('q'), [], [], [], []))
+
+    # lines are parsed as bytes and only the string fields are decoded, with 
+    # each distinct string field decoded once
+    bdelimiter = delimiter.encode('utf-8')
+    decoded = {}
+
+    # bound locally as it is checked on every line
+    max_position = interface_tools.MAX_POSITION
+    
+    for linecount, bline in enumerate(lines, first_line):
+
+        # strip once and check for comment lines inline, rather than 
+        # calling is_comment_line() (which strips again) on every line
+        bline = bline.strip()
+        if bline[:1] == b'#':
+            continue
+
+        # the key/value pairs (if present) are left as a single unsplit tail
+        sline = bline.split(bdelimiter, 5)
+
+        # lines with too few fields are caught by a length check rather
+        # than by raising and catching an IndexError
+        if len(sline) < 5:
+            error = f'expected at least 5 fields but found {len(sline)}'
+        else:
+            try:
+                unique_ID = decoded.get(sline[0])
+                if unique_ID is None:
+                    unique_ID = decoded[sline[0]] = sline[0].strip().decode('utf-8')
+
+                position = int(sline[1])
+                if abs(position) > max_position:
+                    raise ValueError('position out of range')
+
+                site_type = decoded.get(sline[2])
+                if site_type is None:
+                    site_type = decoded[sline[2]] = sline[2].strip().decode('utf-8')
+
+                symbol = decoded.get(sline[3])
+                if symbol is None:
+                    symbol = decoded[sline[3]] = sline[3].strip().decode('utf-8')
+
+                # this enables the value to be None if you
+                # write a symbol where there's no value associated
+                # with a site
+                tmp = sline[4].strip()
+                if tmp == b'None':
+                    value = None
+                else:
+                    value = float(tmp)
+
+                error = None
+            except Exception as e:
+                conversions = [(int, sline[1])]
+                if sline[4].strip() != b'None':
+                    conversions.append((float, sline[4]))
+                error = interface_tools.decoded_error_message(e, conversions)
+
+        if error is not None:
+            # in worker processes bad lines are handed back to the parent,
+            # which knows their line number in the whole file
+            if skipped is not None:
+                if not skip_bad:
+                    return None
+                skipped.append((linecount, error, bline))
+                continue
+
+            msg = interface_tools.bad_line_message(filename, linecount, error, bline)
+
+            # should update this to also display the actual error...
+            if skip_bad:
+                shephard_exceptions.print_warning(msg + "\nSkipping this line...")
+                continue
+            else:
+                raise InterfaceException(msg)
+
+        # most lines have no key/value pairs, in which case no dictionary is 
+        # created here (each Site creates its own when passed None). 
+        # Otherwise parse the attribute dictionary entries
+        if len(sline) == 5:
+            attributes = None
+        else:
+            try:
+                attributes = interface_tools.parse_key_value_pairs_bytes(sline[5], bdelimiter, filename, linecount, bline)
+            except InterfaceException:
+                if skipped is not None:
+                    return None
+                raise
+
+        columns = ID2site[unique_ID]
+        columns[0].append(position)
+        columns[1].append(site_type)
+        columns[2].append(symbol)
+        columns[3].append(value)
+        columns[4].append(attributes)
+
+    # convert to a plain dictionary so the result can be pickled
+    return dict(ID2site)
+
 
 class _SitesInterface:
 
-    def __init__(self, filename, delimiter='\t', skip_bad=True):
+    def __init__(self, filename, delimiter='\t', skip_bad=True, workers=None):
         """
         Expect files of the following format:
         
@@ -31,6 +196,23 @@ class _SitesInterface:
         key:value pairs are optional. Key value must be separated by a ':', 
         but any delimiter (other than ':') is allowed. 
 
+        When created, this constructor parses the file to generate a 
+        .columns class object, which maps a uniqueID to a structure-of-arrays
+        namespace with the following attributes:
+
+            positions            : array('q') of site positions
+            site_types           : list of site type strings
+            symbols              : list of site symbol strings
+            values               : list of site values (float, or None where
+                                   a site has no value)
+            attributes           : list of attribute dictionaries (None where
+                                   a site has no attributes)
+
+        These are the columns exactly as parsed, so no conversion is done
+        here. The .data property builds the standard sites dictionary (a 
+        uniqueID to a list of site dictionaries) from these columns on 
+        demand.
+
         Parameters
         ----------------
         
@@ -45,67 +227,69 @@ class _SitesInterface:
             are encountered the code will just skip them. By default this is 
             true, which adds a certain robustness to file parsing, but could 
             also hide errors. Note that if lines are skipped a warning will be 
-            printed (regardless of verbose flag). 
+            printed (regardless of verbose flag).
 
+        workers : int (default = None)
+            If set to an integer greater than 1 the file is split into 
+            this many chunks (at line boundaries) which are parsed in 
+            parallel in separate processes. Only worthwhile for very
+            large files. Note that on platforms where worker processes
+            are started with spawn (macOS and Windows) the calling 
+            script must be guarded with ``if __name__ == '__main__':``.
 
         """
 
         if delimiter == ':':
             raise InterfaceException('When parsing site file cannot use ":" as a delimeter because this is used to delimit key/value pairs (if provided)')
 
+        if workers is None or workers <= 1:
+            ID2site = _parse_site_lines(interface_tools.read_file_lines(filename), 1, filename, delimiter, skip_bad)
+        else:
 
-        with open(filename,'r') as fh:
-            content = fh.readlines()
-
-        ID2site={}
-        
-        linecount=0
-        for line in content:
+            # split the file at line boundaries and parse each chunk in its own process
+            ID2site = interface_tools.parse_file_in_parallel(filename, _parse_site_lines, workers, delimiter, skip_bad)
 
-            linecount = linecount + 1
+        self.columns = {}
+        for unique_ID, (positions, site_types, symbols, values, attributes) in ID2site.items():
+            self.columns[unique_ID] = SimpleNamespace(positions=positions,
+                                                      site_types=site_types,
+                                                      symbols=symbols,
+                                                      values=values,
+                                                      attributes=attributes)
 
-            # skip comment lines
-            if interface_tools.is_comment_line(line):
-                continue
-
-            sline = line.strip().split(delimiter)
-
-            try:
-                unique_ID = sline[0].strip()
-                position = int(sline[1].strip())
-                site_type = sline[2].strip()
-                symbol = sline[3].strip()
 
-                # this enables the value to be None if you
-                # write a symbol where there's no value associated
-                # with a site
-                tmp = sline[4].strip()
-                if tmp == 'None':
-                    value = None
-                else:
-                    value = float(tmp)
+    @property
+    def rows(self):
+        """
+        Returns a dictionary that maps each uniqueID to an iterator of 
+        SiteRow tuples, one per site.
+        """
 
-                attributes = {}
-            except Exception as e:
-                msg = f'Failed parsing file [{filename}] on line [{linecount}].\n\nException raised: {str(e)}\n\nline printed below:\n{line}'
+        return {unique_ID: map(SiteRow._make, zip(c.positions, c.site_types, c.symbols, c.values, c.attributes)) for unique_ID, c in self.columns.items()}
 
-                # should update this to also display the actual error...
-                if skip_bad:
-                    shephard_exceptions.print_warning(msg + "\nSkipping this line...")
-                    continue
-                else:
-                    raise InterfaceException(msg)
 
-            # if there's more parse attribute dictionary entries
-            if len(sline) > 5:
-                attributes = interface_tools.parse_key_value_pairs(sline[5:], filename, linecount, line)
+    @property
+    def data(self):
+        """
+        Returns the parsed sites as a standard sites dictionary, where each 
+        uniqueID maps to a list of site dictionaries.
+        """
 
-            if unique_ID in ID2site:
-                ID2site[unique_ID].append({'position':position, 'site_type':site_type, 'symbol':symbol, 'value':value, 'attributes':attributes})
-            else:
-                ID2site[unique_ID] =[{'position':position, 'site_type':site_type, 'symbol':symbol, 'value':value, 'attributes':attributes}]
+        # built straight from the parsed columns rather than via SiteRow. 
+        # Every dictionary built here survives, so the cyclic garbage 
+        # collector can free nothing while they are built but would 
+        # otherwise repeatedly rescan them all; it is paused until done
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            ID2site = {}
+            for unique_ID, c in self.columns.items():
+                ID2site[unique_ID] = [{'position':position, 'site_type':site_type, 'symbol':symbol, 'value':value, 'attributes':attributes if attributes is not None else {}} for position, site_type, symbol, value, attributes in zip(c.positions, c.site_types, c.symbols, c.values, c.attributes)]
+        finally:
+            if gc_was_enabled:
+                gc.enable()
 
-        self.data = ID2site
+        return ID2site
 
 
 
@@ -118,7 +302,7 @@ class _SitesInterface:
 
 ## ------------------------------------------------------------------------
 ##
-def add_sites_from_file(proteome, filename, delimiter='\t', return_dictionary=False, safe=True, skip_bad=True, verbose=True):
+def add_sites_from_file(proteome, filename, delimiter='\t', return_dictionary=False, safe=True, skip_bad=True, verbose=True, workers=None):
     r"""
     Function that provides the user-facing interface for reading correctly 
     configured SHEPHARD sites files and adding those sites to the proteins 
@@ -174,6 +358,15 @@ def add_sites_from_file(proteome, filename, delimiter='\t', return_dictionary=Fa
     verbose : bool (default = True)
         Flag that defines how 'loud' output is. Will warn about errors 
         on adding sites.
+
+    workers : int (default = None)
+        If set to an integer greater than 1 the file is split into this 
+        many chunks which are parsed in parallel in separate processes. 
+        This is only worthwhile for very large files, where parsing 
+        dominates over the cost of starting the worker processes. Note 
+        that on platforms where worker processes are started with spawn 
+        (macOS and Windows) the calling script must be guarded with 
+        ``if __name__ == '__main__':``.
         
     Returns
     ---------
@@ -189,14 +382,14 @@ def add_sites_from_file(proteome, filename, delimiter='\t', return_dictionary=Fa
     # check first argument is a proteome
     interface_tools.check_proteome(proteome, 'add_sites_from_file (si_sites)')
 
-    sites_interface = _SitesInterface(filename, delimiter, skip_bad)
+    sites_interface = _SitesInterface(filename, delimiter, skip_bad, workers=workers)
 
     if return_dictionary:
         return sites_interface.data
 
 
-    # finally add the site from the dictionary generated by the SitesInterface parser
-    add_sites_from_dictionary(proteome, sites_interface.data, safe, verbose)
+    # finally add the site from the columns generated by the SitesInterface parser
+    __add_site_rows(proteome, sites_interface.rows, safe, verbose)
 
 
 
@@ -262,37 +455,87 @@ def add_sites_from_dictionary(proteome, sites_dictionary, safe=True, verbose=Fal
     
     """
     
+    # convert each list of site dictionaries into SiteRow tuples
+    uid2rows = {}
+    for unique_ID, sites in sites_dictionary.items():
+        uid2rows[unique_ID] = (__site_dictionary_to_row(unique_ID, site) for site in sites)
+
+    __add_site_rows(proteome, uid2rows, safe, verbose)
+
+
+## ------------------------------------------------------------------------
+##
+def __site_dictionary_to_row(unique_ID, site):
+    """
+    Internal function that takes a site dictionary (as described in 
+    add_sites_from_dictionary()) and returns the equivalent SiteRow.
+
+    Parameters
+    -------------
+    unique_ID : str
+        unique_ID the site is associated with. Only used when raising an 
+        exception.
+
+    site : dict
+        Site dictionary 
+
+    Returns
+    ---------
+    SiteRow
+        Returns a SiteRow with the site's position, site_type, symbol, 
+        value and attributes
+    
+    """
+    try:
+        position = site['position']
+        site_type = site['site_type']
+        symbol = site['symbol']
+        value = site['value']
+
+        # a missing attributes dictionary is passed on as None, and each 
+        # Site then creates its own empty dictionary
+        ad = site.get('attributes')
+    except Exception:
+        raise InterfaceException('When sites dictionary for key [%s] was unable to extract five distinct parametes. Entry is:\n%s\n'% (unique_ID, site))
+
+    return SiteRow(position, site_type, symbol, value, ad)
+
+
+## ------------------------------------------------------------------------
+##
+def __add_site_rows(proteome, uid2rows, safe=True, verbose=False):
+    """
+    Internal function that adds sites to the proteins in the Proteome, 
+    where sites are passed as a dictionary that maps unique_IDs to an 
+    iterable of SiteRow tuples. 
+    This is called internally by functions that add Sites, and the safe 
+    and verbose keywords are as described in add_sites_from_dictionary().
+
+    Parameters
+    -------------
+    proteome : Proteome
+        Proteome object to which we're adding sites. 
+
+    uid2rows : dict
+        Dictionary that maps unique_IDs to an iterable of one or more 
+        SiteRow tuples
+
+    Returns
+    ---------
+    None
+        No return value, but adds all of the passed sites to the protein
+    
+    """
+
     for protein in proteome:
-        if protein.unique_ID in sites_dictionary:
-            for site in sites_dictionary[protein.unique_ID]:
-
-                try:
-                    position = site['position']
-                    site_type = site['site_type']
-                    symbol = site['symbol']
-                    value = site['value']
-                    try:
-                        ad = site['attributes'] 
-                    except:
-                        ad = {}
-                except Exception:
-                    raise InterfaceException('When sites dictionary for key [%s] was unable to extract five distinct parametes. Entry is:\n%s\n'% (protein.unique_ID, site))
-
-                # assuming we can read all five params try and add the site
-                try:
-                    protein.add_site(position, site_type, symbol, value, attributes = ad)                
-
-                except ProteinException as e:
-                    msg='- skipping site %s at %i on %s' %(site_type, position, protein)
-                    if safe:
-                        shephard_exceptions.print_and_raise_error(msg, e)
-                    else:
-                        if verbose:
-                            shephard_exceptions.print_warning(msg)
-                            continue
-  
-
-                  
+        rows = uid2rows.get(protein.unique_ID)
+        if rows is None:
+            continue
+
+        # each protein's sites are added in a single batch
+        protein._add_site_rows(rows, safe=safe, verbose=verbose)
+
+
 ## ------------------------------------------------------------------------
 ##
 def write_sites(proteome, filename, delimiter='\t', site_types=None):
@@ -331,7 +574,9 @@ def write_sites(proteome, filename, delimiter='\t', site_types=None):
 
     """
 
-    with open(filename, 'w') as fh:
+    with open(filename, 'wb', buffering=1<<20) as fh:
+
+        lines = []
         for protein in proteome:
             for s in protein.sites:
 
@@ -343,9 +588,15 @@ def write_sites(proteome, filename, delimiter='\t', site_types=None):
                 # build a line 
                 # if the passed parameter site_types is being
                 # used
-                line = __build_site_line(s, delimiter)
+                lines.append(__build_site_line(s, delimiter))
+
+                # encode and write out in batches rather than once per site
+                if len(lines) == 10000:
+                    fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                    lines.clear()
 
-                fh.write(f"{line}")
+        if lines:
+            fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
 
 
 
@@ -385,17 +636,22 @@ def write_sites_from_list(site_list, filename, delimiter='\t'):
     for s in site_list:
         interface_tools.check_site(s, 'write_sites_from_list')
 
-    with open(filename, 'w') as fh:
+    with open(filename, 'wb', buffering=1<<20) as fh:
 
         # for each site in the list
+        lines = []
         for s in site_list:
 
             # build a line 
-            # if the passed parameter site_types is being
-            # used
-            line = __build_site_line(s, delimiter)
+            lines.append(__build_site_line(s, delimiter))
 
-            fh.write(f"{line}")
+            # encode and write out in batches rather than once per site
+            if len(lines) == 10000:
+                fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
+                lines.clear()
+
+        if lines:
+            fh.write(('\n'.join(lines) + '\n').encode('utf-8'))
 
 
 
@@ -420,25 +676,18 @@ def __build_site_line(s, delimiter):
     Returns
     --------------
     str
-        Returns a string that is ready to be written to file
+        Returns a string that is ready to be written to file (without a
+        trailing newline)
 
     """
 
-    # systematically construct each line in the file 
-    line = ''
-    line = line + str(s.protein.unique_ID) + delimiter
-    line = line + str(s.position) + delimiter
-    line = line + str(s.site_type) + delimiter                
-    line = line + str(s.symbol) + delimiter
-
-    # note last required element has no trailing delimiter
-    line = line + str(s.value) 
+    # collect each field in the line and join once at the end
+    parts = [str(s.protein.unique_ID), str(s.position), str(s.site_type), str(s.symbol), str(s.value)]
     
-    if s.attributes:
-        for k in s.attributes:
-            atrbt = interface_tools.full_clean_string(s.attribute(k))
-            line = line + delimiter + f"{k}:{atrbt}"
-
-    line = line + "\n"
+    # .attributes builds a new list of names on each access, so fetch it once
+    attributes = s.attributes
+    if attributes:
+        attribute = s.attribute
+        parts.extend([f"{k}:{interface_tools.full_clean_string(attribute(k))}" for k in attributes])
 
-    return line
+    return delimiter.join(parts)
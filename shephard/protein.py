@@ -17,6 +17,7 @@ from .track import Track
 from .exceptions import ProteinException
 from .import general_utilities
 from .interfaces.si_domains import add_domains_from_dictionary
+from .interfaces.si_sites import add_sites_from_dictionary
 
 
 # <><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>
@@ -2037,18 +2038,133 @@ class Protein:
             can be associated with a protein. 
         
         """
+
+        self.__add_site(position, site_type, symbol, value, attributes)
+
+
+    ## ------------------------------------------------------------------------
+    ##
+    def add_sites(self, list_of_sites, safe=True, verbose=False):
+        """
+        Function that takes a list of site dictionaries and adds those 
+        sites to the protein.
+
+        Each site dictionary within the list must have a key-value pair 
+        that defines the following info:
+
+        * **position** - site position (in real sequence, not i0 indexing)
+        * **site_type** - type of the site (string)
+        * **symbol** - site symbol (string or None)
+        * **value** - site value (float or None)
+        * **attributes** - a dictionary of attributes to associated with the site (optional)
+
+        Note that position, site_type, symbol and value are the required 
+        key-value pairs in the dictionary.
+
+        If you wish to add many sites to many proteins, see 
+        interfaces.si_sites.add_sites_from_dictionary()
+
+        Parameters
+        -------------
+
+        list_of_sites : list 
+            A list of site dictionaries. A "site dictionary" is defined above, 
+            but in short is a dictionary with the following key-value pairs:
+
+            * REQUIRED:
+               * position - int (site position)
+               * site_type - string (site type)
+               * symbol - string (site symbol, can be None)
+               * value - float (site value, can be None)
+
+            * OPTIONAL:
+               * attributes - dictionary of arbitrary key-value pairs that will be associated with the site
+
+        safe : bool (default = True)
+            If set to True a site that falls outside the protein will 
+            raise an exception. If False, such sites are skipped.
+
+        verbose : bool (default = False)
+            Flag that defines how 'loud' output is. If True and safe=False
+            a warning is printed for each site that is skipped.
+
+        Returns
+        -------
+        None
+            No return value, but will add the passed sites to the protein or 
+            throw an exception if something goes wrong!
         
+        """
+
+        # create the input dictionary
+        in_dict = {self.unique_ID:list_of_sites}
+        add_sites_from_dictionary(self.proteome, in_dict, safe=safe, verbose=verbose)
+
+
+    ## ------------------------------------------------------------------------
+    ##
+    def _add_site_rows(self, rows, safe=True, verbose=False):
+        """
+        Internal function that adds sites passed as 
+        (position, site_type, symbol, value, attributes) tuples, such as 
+        interfaces.si_sites.SiteRow. This is the batch path used by
+        interfaces.si_sites, and the safe and verbose keywords are as 
+        described in add_sites().
+
+        Parameters
+        -------------
+        rows : iterable
+            Iterable of (position, site_type, symbol, value, attributes)
+            tuples
+
+        Returns
+        -------
+        None
+            No return value, but will add the passed sites to the protein or 
+            throw an exception if something goes wrong!
+
+        """
+
+        add_site = self.__add_site
+        for position, site_type, symbol, value, attributes in rows:
+            try:
+                add_site(position, site_type, symbol, value, attributes)
+
+            except ProteinException as e:
+                msg = '- skipping site %s at %i on %s' %(site_type, position, self)
+                if safe:
+                    exceptions.print_and_raise_error(msg, e)
+                elif verbose:
+                    exceptions.print_warning(msg)
+
+
+    ## ------------------------------------------------------------------------
+    ##
+    def __add_site(self, position, site_type, symbol, value, attributes):
+        """
+        Internal function that checks a site falls inside the protein and, if
+        it does, adds it. Shared by add_site() and _add_site_rows(); 
+        arguments are as described in add_site().
+
+        Returns
+        -------
+        None
+            No return value, but raises a ProteinException if the position
+            falls outside the protein.
+
+        """
+
         # recal inside_regions is inclusive
         if not sequence_utilities.inside_region(1, self._len, position):
             raise ProteinException("Trying to add site to protein [%s] at positions [%i] - this falls outside the protein's dimensions [%i-%i]" %(str(self), position, 1, self._len))
 
-        # cast the position to an int and if there are no sites at that position create an empty list there
-        position = int(position)        
-        if position not in self._sites:
-            self._sites[position] = []
-
-        # add the site!
-        self._sites[position].append(Site(position, site_type, self, symbol, value, attributes))
+        # cast the position to an int and if there are no sites at that position create a new list there
+        position = int(position)
+        site = Site(position, site_type, self, symbol, value, attributes)
+        if position in self._sites:
+            self._sites[position].append(site)
+        else:
+            self._sites[position] = [site]
 
 
     ## ------------------------------------------------------------------------
@@ -0,0 +1,18 @@
+import pytest
+from shephard.apis import uniprot
+from shephard.exceptions import UtilitiesException
+
+
+def test_uniprot_accession_from_line():
+
+    assert uniprot.uniprot_accession_from_line('>sp|O00401|WASL_HUMAN Neural Wiskott-Aldrich') == 'O00401'
+    assert uniprot.uniprot_accession_from_line(b'>sp|O00401|WASL_HUMAN Neural Wiskott-Aldrich') == 'O00401'
+
+    # a single pipe means everything after it is the accession
+    assert uniprot.uniprot_accession_from_line('>sp| O00401 ') == 'O00401'
+
+    with pytest.raises(UtilitiesException):
+        uniprot.uniprot_accession_from_line('>O00401')
+
+    with pytest.raises(UtilitiesException):
+        uniprot.uniprot_accession_from_line(None)
@@ -0,0 +1,76 @@
+import pytest
+
+from shephard.interfaces import interface_tools
+from shephard.exceptions import InterfaceException
+
+
+def test_read_file_lines(tmp_path):
+
+    fn = tmp_path / 'lines.tsv'
+
+    # trailing line without a newline should still be returned
+    fn.write_bytes(b'a\tb\nc\td\ne')
+    assert list(interface_tools.read_file_lines(str(fn))) == [b'a\tb', b'c\td', b'e']
+
+    fn.write_bytes(b'a\tb\n')
+    assert list(interface_tools.read_file_lines(str(fn))) == [b'a\tb']
+
+    # Windows and old Mac (CR-only) line endings are also split
+    fn.write_bytes(b'a\tb\r\nc\td\r\n')
+    assert list(interface_tools.read_file_lines(str(fn))) == [b'a\tb', b'c\td']
+
+    fn.write_bytes(b'a\tb\rc\td\r')
+    assert list(interface_tools.read_file_lines(str(fn))) == [b'a\tb', b'c\td']
+
+    fn.write_bytes(b'')
+    assert list(interface_tools.read_file_lines(str(fn))) == []
+
+
+def test_parse_key_value_pairs_bytes():
+
+    line = b'O00401\t1\t20\tIDR\tkey1:value1\tkey2 : value 2'
+    tail = line.split(b'\t', 4)[4]
+
+    attributes = interface_tools.parse_key_value_pairs_bytes(tail, b'\t', 'test.tsv', 1, line)
+    assert attributes == {'key1':'value1', 'key2':'value 2'}
+
+    # should match the string-based parser
+    assert attributes == interface_tools.parse_key_value_pairs(tail.decode().split('\t'), 'test.tsv', 1, line.decode())
+
+    # multi-character delimiters are fine
+    assert interface_tools.parse_key_value_pairs_bytes(b'a:1, b:2', b', ', 'test.tsv', 1, b'') == {'a':'1', 'b':'2'}
+
+    # missing ':' is an error
+    with pytest.raises(InterfaceException):
+        interface_tools.parse_key_value_pairs_bytes(b'a:1\tb', b'\t', 'test.tsv', 1, b'')
+
+
+def test_find_file_chunks(tmp_path):
+
+    fn = tmp_path / 'lines.tsv'
+    lines = [b'line_%i\tvalue' % (i) for i in range(100)]
+    fn.write_bytes(b'\n'.join(lines) + b'\n')
+
+    for n_chunks in [1, 2, 3, 7, 200]:
+        chunks = interface_tools.find_file_chunks(str(fn), n_chunks)
+        assert len(chunks) <= n_chunks
+
+        # reading each chunk back should give every line exactly once
+        recovered = []
+        for start, end in chunks:
+            recovered.extend(interface_tools.read_file_lines(str(fn), start, end))
+
+        assert recovered == lines
+
+
+def test_decoded_error_message():
+
+    # the message matches the one raised when parsing str fields
+    try:
+        int(b'1.0')
+    except ValueError as e:
+        assert interface_tools.decoded_error_message(e, [(int, b' 1.0')]) == "invalid literal for int() with base 10: '1.0'"
+
+    # if every conversion works on the decoded fields the original message is kept
+    e = ValueError('position out of range')
+    assert interface_tools.decoded_error_message(e, [(int, b'1'), (float, b'2.5')]) == 'position out of range'
@@ -11,7 +11,7 @@ Holehouse Lab - Washington University in St. Louis
 import pytest
 import shephard
 from shephard.interfaces import si_sites
-from shephard.exceptions import ProteinException
+from shephard.exceptions import ProteinException, InterfaceException
 from shephard.apis import uniprot  
 
 test_data_dir = shephard.get_data('test_data')
@@ -171,3 +171,33 @@ def test_get_site_by_type_and_range():
 
     
     
+
+
+def test_add_sites(capsys):
+    TS1 = uniprot.uniprot_fasta_to_proteome('%s/%s' % (test_data_dir,'testset_1.fasta'))
+    protein = TS1.protein('O00470')
+
+    protein.add_sites([{'position':1, 'site_type':'site_a', 'symbol':'S', 'value':1.0},
+                       {'position':10, 'site_type':'site_b', 'symbol':None, 'value':None, 'attributes':{'k':'v'}},
+                       {'position':10, 'site_type':'site_c', 'symbol':None, 'value':None}])
+    assert len(protein.sites) == 3
+    assert len(protein.site(10)) == 2
+    assert protein.site(10)[0].attribute('k') == 'v'
+    assert protein.site(1)[0].symbol == 'S'
+    assert protein.site(1)[0].value == 1.0
+
+    # a site outside the protein raises an exception...
+    with pytest.raises(ProteinException):
+        protein.add_sites([{'position':1000, 'site_type':'site_e', 'symbol':None, 'value':None}])
+    assert len(protein.sites) == 3
+    assert 'ERROR: - skipping site site_e at 1000' in capsys.readouterr().out
+
+    # ...unless safe=False, in which case the bad site is skipped
+    protein.add_sites([{'position':20, 'site_type':'site_d', 'symbol':None, 'value':None}, 
+                       {'position':1000, 'site_type':'site_e', 'symbol':None, 'value':None}], safe=False)
+    assert len(protein.sites) == 4
+    assert protein.site(20)[0].site_type == 'site_d'
+
+    # site dictionaries missing required keys are rejected
+    with pytest.raises(InterfaceException):
+        protein.add_sites([{'position':30, 'site_type':'site_f'}])
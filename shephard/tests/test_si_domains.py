@@ -4,7 +4,7 @@ import shephard
 from shephard.apis import uniprot  
 from shephard.interfaces import si_domains
 import numpy as np
-from shephard.exceptions import ProteinException, DomainException
+from shephard.exceptions import ProteinException, DomainException, InterfaceException
 import random
 
 
@@ -142,3 +142,106 @@ def test_write_domains():
         assert p.get_domains_by_type('test_domain_0')[0].end == uid2domain_info[p.unique_ID][0][1]
         assert p.get_domains_by_type('test_domain_1')[0].end == uid2domain_info[p.unique_ID][1][1]
         assert p.get_domains_by_type('test_domain_2')[0].end == uid2domain_info[p.unique_ID][2][1]
+
+
+def test_add_domains_file_workers():
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = '%s/%s' % (test_data_dir, 'TS1_domains_idr_and_others.tsv')
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+    serial = si_domains.add_domains_from_file(P, domain_file, return_dictionary=True)
+    parallel = si_domains.add_domains_from_file(P, domain_file, return_dictionary=True, workers=4)
+    assert serial == parallel
+
+    si_domains.add_domains_from_file(P, domain_file, workers=4)
+    assert len(P.domains) == sum([len(v) for v in serial.values()])
+
+
+def test_add_domains_file_attributes_not_shared():
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = '%s/%s' % (test_data_dir, 'TS1_domains_idr.tsv')
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+    si_domains.add_domains_from_file(P, domain_file)
+
+    # domains read without attributes must each get their own dictionary
+    P.protein('O00401').domains[0].add_attribute('test_attribute', 1)
+    assert P.protein('O00401').domains[1].attributes == []
+    assert P.protein('O00470').domains[0].attributes == []
+
+    # and the returned dictionary keeps an empty attributes dictionary
+    domain_dict = si_domains.add_domains_from_file(P, domain_file, return_dictionary=True)
+    assert domain_dict['O00401'][0]['attributes'] == {}
+
+
+def test_add_domains_file_position_out_of_range(tmp_path):
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = tmp_path / 'domains_out_of_range.tsv'
+    domain_file.write_text('O00401\t1\t%i\tIDR\nO00401\t1\t10\tIDR\n' % (2**64))
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+
+    # a position too large to store is skipped like any other bad line...
+    domain_dict = si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True)
+    assert len(domain_dict['O00401']) == 1
+    assert domain_dict['O00401'][0]['end'] == 10
+
+    # ...or raises an InterfaceException if bad lines are not skipped
+    with pytest.raises(InterfaceException):
+        si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True, skip_bad=False)
+
+
+def test_add_domains_file_large_position(tmp_path):
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = tmp_path / 'domains_large_position.tsv'
+    domain_file.write_text('O00401\t1\t3000000000\tIDR\n')
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+
+    # positions beyond the range of a 32-bit int are still returned intact
+    domain_dict = si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True)
+    assert domain_dict['O00401'][0]['end'] == 3000000000
+    assert type(domain_dict['O00401'][0]['end']) is int
+
+
+def test_add_domains_file_workers_bad_line(tmp_path, capsys):
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = tmp_path / 'domains_bad_line.tsv'
+    lines = ['O00401\t1\t%i\tIDR' % (i) for i in range(2, 300)]
+    lines[250] = 'O00401\t1\tnot_a_position\tIDR'
+    domain_file.write_text('\n'.join(lines) + '\n')
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+
+    # bad lines are skipped in parallel just as they are serially...
+    serial = si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True)
+    parallel = si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True, workers=4)
+    assert serial == parallel
+    assert len(parallel['O00401']) == len(lines) - 1
+
+    # the skipped line is reported once per parse, with its line number in the whole file
+    out = capsys.readouterr().out
+    assert out.count('on line [251]') == 2
+    assert out.count('Skipping this line') == 2
+
+    # ...and are reported with their line number in the whole file
+    with pytest.raises(InterfaceException, match=r'on line \[251\]'):
+        si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True, skip_bad=False, workers=4)
+
+
+def test_add_domains_file_cr_line_endings(tmp_path):
+
+    fasta_file = '%s/%s' % (test_data_dir, 'testset_1.fasta')
+    domain_file = tmp_path / 'domains_cr.tsv'
+    domain_file.write_bytes(b'O00401\t1\t20\tIDR\rO00401\t2\t20\tIDR\r')
+
+    P = uniprot.uniprot_fasta_to_proteome(fasta_file)
+
+    # CR-only line endings (e.g. old Mac text exports) are split into lines
+    domain_dict = si_domains.add_domains_from_file(P, str(domain_file), return_dictionary=True)
+    assert [d['start'] for d in domain_dict['O00401']] == [1, 2]
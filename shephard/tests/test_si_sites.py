@@ -1,3 +1,4 @@
+import gc
 import pytest
 
 from shephard.exceptions import ProteinException
@@ -151,3 +152,60 @@ def test_write_sites_from_list():
 
             
             
+
+def test_si_site_return_dictionary():
+
+    TS1 = uniprot.uniprot_fasta_to_proteome('%s/%s' % (test_data_dir,'testset_1.fasta'))
+
+    sites_dict = si_sites.add_sites_from_file(TS1, '%s/%s' % (test_data_dir, 'ts1_bonus_sites.tsv'), return_dictionary=True)
+
+    # nothing should have been added to the proteome
+    assert len(TS1.sites) == 0
+
+    # garbage collection is only paused while the dictionary is built
+    assert gc.isenabled()
+
+    first = sites_dict['O00470'][0]
+    assert first == {'position':1, 'site_type':'TEST_SITE_N', 'symbol':'True', 'value':10.0, 'attributes':{}}
+    assert type(first['position']) is int
+
+    # the dictionary can be passed straight back in
+    si_sites.add_sites_from_dictionary(TS1, sites_dict)
+    assert len(TS1.protein('O00470').site(1)) == 1
+
+def test_si_site_add_from_file_workers():
+
+    TS1 = uniprot.uniprot_fasta_to_proteome('%s/%s' % (test_data_dir,'testset_1.fasta'))
+    serial = si_sites.add_sites_from_file(TS1, '%s/%s' % (test_data_dir, 'TS1_sites.tsv'), return_dictionary=True)
+    parallel = si_sites.add_sites_from_file(TS1, '%s/%s' % (test_data_dir, 'TS1_sites.tsv'), return_dictionary=True, workers=3)
+
+    assert serial == parallel
+
+    si_sites.add_sites_from_file(TS1, '%s/%s' % (test_data_dir, 'TS1_sites.tsv'), workers=3)
+    assert len(TS1.sites) == sum([len(v) for v in serial.values()])
+
+def test_si_site_large_position(tmp_path):
+
+    TS1 = uniprot.uniprot_fasta_to_proteome('%s/%s' % (test_data_dir,'testset_1.fasta'))
+    site_file = tmp_path / 'sites_large_position.tsv'
+    site_file.write_text('O00401\t3000000000\tTEST_SITE\tK\t1.0\n')
+
+    # positions beyond the range of a 32-bit int are still returned intact
+    sites_dict = si_sites.add_sites_from_file(TS1, str(site_file), return_dictionary=True)
+    assert sites_dict['O00401'][0]['position'] == 3000000000
+    assert type(sites_dict['O00401'][0]['position']) is int
+
+def test_si_site_bad_line_warning(tmp_path, capsys):
+
+    TS1 = uniprot.uniprot_fasta_to_proteome('%s/%s' % (test_data_dir,'testset_1.fasta'))
+    site_file = tmp_path / 'sites_bad_value.tsv'
+    site_file.write_text('O00401\t1.0\tTEST_SITE\tK\t1.0\nO00401\t2\tTEST_SITE\tK\tx\n')
+
+    sites_dict = si_sites.add_sites_from_file(TS1, str(site_file), return_dictionary=True)
+    assert sites_dict == {}
+
+    # warnings quote the offending fields as strings, not bytes
+    out = capsys.readouterr().out
+    assert "invalid literal for int() with base 10: '1.0'" in out
+    assert "could not convert string to float: 'x'" in out
+    assert "b'" not in out